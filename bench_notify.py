@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# _*_ coding:utf-8 _*_
+"""
+notify.send 压测脚本。
+
+在子进程中启动模拟各推送服务的本地 HTTP 服务和 SMTP 服务，把 notify.py 发出的请求全部
+改写到本地，按启用的渠道数分别统计吞吐量、端到端延迟（p50/p99）、线程数峰值和内存峰值。
+
+用法：
+    python bench_notify.py
+    python bench_notify.py --channels 1,5,20 --messages 100 --latency 0.05 --error-rate 0.1
+    python bench_notify.py --pool false      # 对比不使用共享连接池时的表现
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# 能让绝大多数渠道判定为推送成功的通用响应
+GENERIC_RESPONSE = {
+    "code": 200,
+    "StatusCode": 0,
+    "errcode": 0,
+    "errmsg": "ok",
+    "errno": 0,
+    "status": "ok",
+    "id": 1,
+    "ret": 0,
+    "ok": True,
+    "content": {"result": ["ok"]},
+    "access_token": "bench",
+    "expires_in": 7200,
+}
+
+# 与通用响应冲突的服务：{主机: 响应体}
+HOST_RESPONSES = {
+    "qmsg.zendee.cn": {"code": 0},
+    "api-bot.aibotk.com": {"code": 0},
+    "push.i-i.me": "success",
+}
+
+# 启用顺序固定的 20 个渠道及其配置，SMTP_SERVER 在运行时填入本地端口
+CHANNEL_CONFIGS = [
+    ("bark", {"BARK_PUSH": "bench"}),
+    ("dingding_bot", {"DD_BOT_TOKEN": "bench", "DD_BOT_SECRET": "bench"}),
+    ("feishu_bot", {"FSKEY": "bench"}),
+    ("telegram_bot", {"TG_BOT_TOKEN": "bench", "TG_USER_ID": "1"}),
+    ("wecom_app", {"QYWX_AM": "corpid,secret,@all,1"}),
+    ("wecom_bot", {"QYWX_KEY": "bench"}),
+    ("custom_notify", {
+        "WEBHOOK_URL": "https://webhook.bench/send",
+        "WEBHOOK_METHOD": "POST",
+        "WEBHOOK_CONTENT_TYPE": "application/json",
+        "WEBHOOK_BODY": "title: $title\ncontent: $content",
+    }),
+    ("smtp", {"SMTP_SSL": "false", "SMTP_EMAIL": "bench@bench", "SMTP_PASSWORD": "bench", "SMTP_NAME": "bench"}),
+    ("go_cqhttp", {"GOBOT_URL": "https://gocq.bench/send_private_msg", "GOBOT_QQ": "user_id=1"}),
+    ("gotify", {"GOTIFY_URL": "https://gotify.bench", "GOTIFY_TOKEN": "bench"}),
+    ("iGot", {"IGOT_PUSH_KEY": "bench"}),
+    ("serverJ", {"PUSH_KEY": "SCTbench"}),
+    ("pushdeer", {"DEER_KEY": "bench"}),
+    ("chat", {"CHAT_URL": "https://chat.bench/", "CHAT_TOKEN": "bench"}),
+    ("pushplus_bot", {"PUSH_PLUS_TOKEN": "bench"}),
+    ("weplus_bot", {"WE_PLUS_BOT_TOKEN": "bench"}),
+    ("qmsg_bot", {"QMSG_KEY": "bench", "QMSG_TYPE": "send"}),
+    ("aibotk", {"AIBOTK_KEY": "bench", "AIBOTK_TYPE": "room", "AIBOTK_NAME": "bench"}),
+    ("pushme", {"PUSHME_KEY": "bench"}),
+    ("chronocat", {"CHRONOCAT_URL": "https://chronocat.bench", "CHRONOCAT_QQ": "user_id=1", "CHRONOCAT_TOKEN": "bench"}),
+]
+
+
+class MockPushHandler(BaseHTTPRequestHandler):
+    """
+    模拟推送服务：请求路径的第一段为原始主机名，按主机返回对应的成功响应。
+    """
+
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分两次写出，不关闭 Nagle 时长连接上会额外等待 40ms 的延迟确认
+    disable_nagle_algorithm = True
+    latency = 0.0
+    error_rate = 0.0
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        if self.latency:
+            time.sleep(self.latency)
+
+        host = self.path.lstrip("/").split("/", 1)[0]
+        if random.random() < self.error_rate:
+            status, body = 500, b'{"code": 500}'
+        else:
+            payload = HOST_RESPONSES.get(host, GENERIC_RESPONSE)
+            status = 200
+            body = payload.encode() if isinstance(payload, str) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+class MockSMTPHandler(socketserver.StreamRequestHandler):
+    """
+    只接收不投递的 SMTP 服务，支持 notify.py 用到的 EHLO/AUTH/MAIL/RCPT/DATA/NOOP/QUIT。
+    """
+
+    def _reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self._reply("220 bench")
+        in_data = False
+        for raw in self.rfile:
+            line = raw.decode(errors="ignore").rstrip("\r\n")
+            if in_data:
+                if line == ".":
+                    in_data = False
+                    self._reply("250 ok")
+                continue
+            command = line.split(" ", 1)[0].upper()
+            if command in ("EHLO", "HELO"):
+                self._reply("250-bench")
+                self._reply("250 AUTH PLAIN LOGIN")
+            elif command == "AUTH":
+                self._reply("235 ok")
+            elif command == "DATA":
+                in_data = True
+                self._reply("354 go ahead")
+            elif command == "QUIT":
+                self._reply("221 bye")
+                return
+            else:
+                self._reply("250 ok")
+
+
+def serve_mocks(latency, error_rate, ports):
+    """
+    子进程入口：启动模拟 HTTP 和 SMTP 服务，并把端口回传给父进程。
+    """
+    random.seed(0)
+    MockPushHandler.latency = latency
+    MockPushHandler.error_rate = error_rate
+    http_server = ThreadingHTTPServer(("127.0.0.1", 0), MockPushHandler)
+    http_server.daemon_threads = True
+    smtp_server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), MockSMTPHandler)
+    smtp_server.daemon_threads = True
+    threading.Thread(target=smtp_server.serve_forever, daemon=True).start()
+    ports.put((http_server.server_address[1], smtp_server.server_address[1]))
+    http_server.serve_forever()
+
+
+def redirect_requests(http_port):
+    """
+    把 requests 发出的所有请求改写到本地模拟服务，原始主机名放在路径的第一段。
+    共享连接池和 requests.post 最终都经过 HTTPAdapter.send，因此两种模式都会被改写。
+    """
+    from requests.adapters import HTTPAdapter
+
+    original_send = HTTPAdapter.send
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        query = f"?{parts.query}" if parts.query else ""
+        request.url = f"http://127.0.0.1:{http_port}/{parts.hostname}{parts.path}{query}"
+        kwargs["proxies"] = None
+        return original_send(self, request, **kwargs)
+
+    HTTPAdapter.send = send
+
+
+class ThreadSampler:
+    """
+    后台按固定间隔采样线程数，记录峰值。
+    """
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            # 减去采样线程自身
+            self.peak = max(self.peak, threading.active_count() - 1)
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def configure(notify, channel_count, smtp_port, pool):
+    """
+    只启用前 channel_count 个渠道，关闭会干扰测量的限速、待发箱等功能。
+    """
+    config = {
+        "CONSOLE": False,
+        "HTTP_POOL": pool,
+        "NOTIFY_RATE_LIMIT": "false",
+        "NOTIFY_OUTBOX": "false",
+        "NOTIFY_STATE_DIR": tempfile.mkdtemp(prefix="bench_notify_"),
+        "SMTP_SERVER": f"127.0.0.1:{smtp_port}",
+    }
+    for _, channel_config in CHANNEL_CONFIGS[:channel_count]:
+        config.update(channel_config)
+    notify.push_config.clear()
+    notify.push_config.update(config)
+    notify.invalidate_channels()
+    enabled = [mode.__name__ for mode in notify.add_notify_function()]
+    expected = [name for name, _ in CHANNEL_CONFIGS[:channel_count]]
+    assert sorted(enabled) == sorted(expected), f"启用的渠道与预期不符：{enabled}"
+
+
+def run_once(notify, messages, wait):
+    """
+    连续推送 messages 条消息，返回每条消息的端到端耗时和总耗时。
+    wait=False 时统计的是 send 返回后到 Future 完成的时间。
+    """
+    latencies = []
+    started = time.perf_counter()
+    if wait:
+        for i in range(messages):
+            t0 = time.perf_counter()
+            notify.send(f"bench {i}", "notify.py benchmark message")
+            latencies.append(time.perf_counter() - t0)
+    else:
+        handles = []
+        for i in range(messages):
+            t0 = time.perf_counter()
+            handle = notify.send(f"bench {i}", "notify.py benchmark message", wait=False)
+            handle.add_done_callback(lambda _, t0=t0: latencies.append(time.perf_counter() - t0))
+            handles.append(handle)
+        for handle in handles:
+            handle.result()
+    return latencies, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="notify.send 压测")
+    parser.add_argument("--channels", default="1,2,5,10,20", help="启用的渠道数，逗号分隔，最多 20")
+    parser.add_argument("--messages", type=int, default=50, help="每轮推送的消息数")
+    parser.add_argument("--latency", type=float, default=0.02, help="模拟服务的响应延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟服务返回 500 的概率")
+    parser.add_argument("--pool", default="true", help="是否使用共享连接池（HTTP_POOL）")
+    parser.add_argument("--nowait", action="store_true", help="使用 send(wait=False) 推送")
+    args = parser.parse_args()
+
+    ports = multiprocessing.Queue()
+    mocks = multiprocessing.Process(
+        target=serve_mocks, args=(args.latency, args.error_rate, ports), daemon=True
+    )
+    mocks.start()
+    http_port, smtp_port = ports.get(timeout=10)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import notify
+
+    # 渠道的输出不计入测量
+    notify.print = lambda *args, **kwargs: None
+    redirect_requests(http_port)
+
+    print(
+        f"消息数 {args.messages}，模拟延迟 {args.latency * 1000:.0f} ms，错误率 {args.error_rate:.0%}，"
+        f"连接池 {args.pool}，{'非阻塞' if args.nowait else '阻塞'}推送"
+    )
+    print(f"{'渠道数':>6} {'消息/秒':>10} {'p50(ms)':>10} {'p99(ms)':>10} {'线程峰值':>8} {'内存峰值(KB)':>12}")
+    for channel_count in [int(n) for n in args.channels.split(",")]:
+        channel_count = min(channel_count, len(CHANNEL_CONFIGS))
+        configure(notify, channel_count, smtp_port, args.pool)
+        # 预热：建立连接、获取 token
+        run_once(notify, 1, True)
+
+        with ThreadSampler() as sampler:
+            latencies, elapsed = run_once(notify, args.messages, not args.nowait)
+
+        # 内存单独测一轮，避免 tracemalloc 的开销影响吞吐和延迟
+        tracemalloc.start()
+        run_once(notify, min(args.messages, 10), not args.nowait)
+        _, memory_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(
+            f"{channel_count:>9} {args.messages / elapsed:>12.1f} "
+            f"{percentile(latencies, 50) * 1000:>11.1f} {percentile(latencies, 99) * 1000:>11.1f} "
+            f"{sampler.peak:>11} {memory_peak / 1024:>16.1f}"
+        )
+
+    mocks.terminate()
+
+
+if __name__ == "__main__":
+    main()
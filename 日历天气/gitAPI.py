@@ -4,6 +4,10 @@ import logging
 from pymysql.constants import CLIENT
 from datetime import datetime, timezone, timedelta
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import cryptography
 
 # ===================== 环境变量配置 =====================
@@ -28,8 +32,18 @@ APP_SECRET = os.getenv("APP_SECRET", "").strip()
 # 天气 API Key（用于和风天气等服务的鉴权）
 API_key = os.getenv("API_key", "").strip()
 
-# 天气查询城市 / 地区编码（如城市 ID、Location Code）
+# 天气查询城市 / 地区编码（如城市 ID、Location Code），多个用英文逗号分隔
 LOCATION = os.getenv("LOCATION", "").strip()
+LOCATIONS = [loc.strip() for loc in LOCATION.split(",") if loc.strip()]
+
+# 多个城市并发获取天气时的最大并发请求数
+WEATHER_WORKERS = int(os.getenv("WEATHER_WORKERS", "8").strip() or 8)
+
+# 数据库连接池最大连接数
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4").strip() or 4)
+
+# 连接池中空闲连接的最长保留时间（秒），超过后关闭
+DB_POOL_IDLE = int(os.getenv("DB_POOL_IDLE", "300").strip() or 300)
 
 # ===================== 全局配置 =====================
 logging.basicConfig(
@@ -58,7 +72,8 @@ API_CONFIG = {
     },
     "weather": {
         "api_key": API_key,
-        "location": LOCATION,  # 郑州气象API城市ID
+        "location": LOCATIONS[0] if LOCATIONS else "",  # 默认城市ID（LOCATION 中的第一个）
+        "locations": LOCATIONS,  # 需要采集天气的全部城市ID，并行获取
         "now_url": "https://pm6vhfyu8v.re.qweatherapi.com/v7/weather/now",
         "3d_url": "https://pm6vhfyu8v.re.qweatherapi.com/v7/weather/3d"
     },
@@ -69,9 +84,92 @@ API_CONFIG = {
 
 
 # ===================== 公共工具类 =====================
+class DBPool:
+    """数据库连接池：取出时 ping 检查连接可用，归还后复用，空闲过久的连接自动关闭"""
+
+    def __init__(self, max_size=DB_POOL_SIZE, idle_timeout=DB_POOL_IDLE):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._idle = []  # [(连接, 归还时间)]
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def acquire(self, timeout=30):
+        """取出一个可用连接，池中没有可用连接时新建；连接数已达上限时等待归还"""
+        if not self._slots.acquire(timeout=timeout):
+            logger.error(f"等待数据库连接超时（最大连接数 {self.max_size}）")
+            return None
+
+        while True:
+            with self._lock:
+                self._evict_idle()
+                conn = self._idle.pop()[0] if self._idle else None
+            if conn is None:
+                break
+            try:
+                conn.ping(reconnect=False)
+                return conn
+            except pymysql.Error as e:
+                logger.warning(f"连接池中的数据库连接已失效，重新获取: {e}")
+                self._close_quietly(conn)
+
+        conn = DBUtil.get_connection()
+        if not conn:
+            self._slots.release()
+        return conn
+
+    def release(self, conn):
+        """归还连接，未提交的事务会被回滚"""
+        try:
+            if conn and conn.open:
+                conn.rollback()
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        except pymysql.Error as e:
+            logger.warning(f"归还数据库连接失败，已关闭: {e}")
+            self._close_quietly(conn)
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        """关闭池中所有空闲连接"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            DBUtil.close_connection(conn)
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        expired = [conn for conn, returned in self._idle if now - returned > self.idle_timeout]
+        if expired:
+            self._idle = [item for item in self._idle if item[0] not in expired]
+            for conn in expired:
+                self._close_quietly(conn)
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except pymysql.Error:
+            pass
+
+
 class DBUtil:
     """数据库工具类（封装公共数据库操作）"""
 
+    pool = DBPool()
+
+    @staticmethod
+    @contextmanager
+    def connection():
+        """从连接池借出连接，with 块结束后归还；获取失败时得到 None"""
+        conn = DBUtil.pool.acquire()
+        try:
+            yield conn
+        finally:
+            if conn:
+                DBUtil.pool.release(conn)
+
     @staticmethod
     def get_connection():
         try:
@@ -121,6 +219,44 @@ class DBUtil:
             if cursor:
                 cursor.close()
 
+    @staticmethod
+    def execute_many(conn, sql, params_list):
+        """批量执行同一条写入SQL，全部成功后统一提交一次，失败则整体回滚"""
+        if not conn:
+            logger.error("数据库连接为空，无法执行SQL")
+            return 0
+        if not params_list:
+            return 0
+
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            # INSERT ... VALUES (%s, ...) 会被 pymysql 合并为一条多行插入语句
+            cursor.executemany(sql, params_list)
+            row_count = cursor.rowcount
+            conn.commit()
+            logger.info(f"批量SQL执行成功，影响行数: {row_count}")
+            return row_count
+        except pymysql.Error as e:
+            logger.error(f"批量SQL执行失败: {e}, SQL: {sql}, 行数: {len(params_list)}")
+            conn.rollback()
+            return 0
+        finally:
+            if cursor:
+                cursor.close()
+
+    @staticmethod
+    def fetch_existing(conn, table, column, values):
+        """一次查询出 values 中已存在于 table.column 的值"""
+        if not values:
+            return set()
+        placeholders = ", ".join(["%s"] * len(values))
+        sql = f"SELECT `{column}` FROM `{table}` WHERE `{column}` IN ({placeholders})"
+        result, _ = DBUtil.execute_sql(conn, sql, tuple(values))
+        if result is None:
+            return None
+        return {str(row[0]) for row in result}
+
 
 class DateUtil:
     """日期时间工具类"""
@@ -243,10 +379,13 @@ class DateUtil:
 class ApiUtil:
     """API请求工具类"""
 
+    # 所有接口共用的 Session，同一主机的请求复用 keep-alive 连接
+    session = requests.Session()
+
     @staticmethod
     def send_get_request(url, headers=None, timeout=10):
         try:
-            response = requests.get(url, headers=headers or {}, timeout=timeout)
+            response = ApiUtil.session.get(url, headers=headers or {}, timeout=timeout)
             response.raise_for_status()
             result = response.json()
             logger.info(f"API请求成功: {url}")
@@ -321,51 +460,53 @@ class CalendarHandler:
 
     @staticmethod
     def insert_rlibiao(data, conn):
-        """插入日历表数据（完全还原原始逻辑，无任何修改）"""
+        """插入日历表数据：一次查出已有日期，新日期批量插入并只提交一次（INSERT IGNORE 跳过并发写入的重复日期）"""
         if not data:
             logger.warning("无日历数据，跳过rlibiao表插入")
             return
 
-        insert_count = 0
+        existing = DBUtil.fetch_existing(conn, "rlibiao", "date", [item['date'] for item in data])
+        if existing is None:
+            logger.error("查询rlibiao表已有日期失败，跳过插入")
+            return
+
+        rows = []
         for item in data:
-            # 检查重复
-            check_sql = "SELECT 1 FROM rlibiao WHERE date = %s"
-            check_result, _ = DBUtil.execute_sql(conn, check_sql, (item['date'],))
-            if check_result:
+            if item['date'] in existing:
                 continue
+            existing.add(item['date'])
 
             # 处理字段：完全还原原始逻辑
             adjusted_type_des = CalendarHandler.format_type_des_for_rlibiao(item)
             lunar_calendar = DateUtil.convert_lunar_to_4chars(item['lunarCalendar'])
+            rows.append((item['date'], item['weekDay'], lunar_calendar, adjusted_type_des, item['type']))
 
-            # 插入数据：完全还原原始参数
-            insert_sql = """
-            INSERT INTO rlibiao (date, weekDay, lunarCalendar, typeDes, type)
-            VALUES (%s, %s, %s, %s, %s)
-            """
-            _, row_count = DBUtil.execute_sql(
-                conn, insert_sql,
-                (item['date'], item['weekDay'], lunar_calendar, adjusted_type_des, item['type']),
-                commit=True
-            )
-            insert_count += row_count
+        insert_sql = """
+        INSERT IGNORE INTO rlibiao (date, weekDay, lunarCalendar, typeDes, type)
+        VALUES (%s, %s, %s, %s, %s)
+        """
+        insert_count = DBUtil.execute_many(conn, insert_sql, rows)
 
         logger.info(f"日历表rlibiao：新增插入 {insert_count} 条数据，其余为重复数据")
 
     @staticmethod
     def insert_today(data, conn):
-        """仅修改today表：typeDes（detailsType=3赋值）+ weekDay数字转汉字"""
+        """仅修改today表：typeDes（detailsType=3赋值）+ weekDay数字转汉字；新日期批量插入并只提交一次（INSERT IGNORE 跳过重复日期）"""
         if not data:
             logger.warning("无日历数据，跳过today表插入")
             return
 
-        insert_count = 0
+        existing = DBUtil.fetch_existing(conn, "today", "today", [item['date'] for item in data])
+        if existing is None:
+            logger.error("查询today表已有日期失败，跳过插入")
+            return
+
+        uptime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows = []
         for item in data:
-            # 检查重复
-            check_sql = "SELECT 1 FROM today WHERE today = %s"
-            check_result, _ = DBUtil.execute_sql(conn, check_sql, (item['date'],))
-            if check_result:
+            if item['date'] in existing:
                 continue
+            existing.add(item['date'])
 
             # 处理字段
             year_tips = f"{item['yearTips']}【{item['chineseZodiac']}】年"
@@ -376,26 +517,27 @@ class CalendarHandler:
             type_des = CalendarHandler.format_type_des_for_today(item)
             # today表专属：weekDay数字转汉字
             weekday_cn = DateUtil.convert_weekday_num_to_cn(item.get('weekDay'))
+            rows.append((item['date'], year_tips, weekday_cn, lunar_calendar, suit, avoid, uptime, type_des))
 
-            # 插入数据（新增typeDes字段，weekDay用转换后的汉字）
-            insert_sql = """
-            INSERT INTO today (today, yearTips, weekDay, lunarCalendar, suit, avoid, uptime, typeDes)
-            VALUES (%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP, %s)
-            """
-            _, row_count = DBUtil.execute_sql(
-                conn, insert_sql,
-                (item['date'], year_tips, weekday_cn, lunar_calendar, suit, avoid, type_des),
-                commit=True
-            )
-            insert_count += row_count
+        # uptime 作为参数传入，VALUES 中只有占位符时 pymysql 才会合并为一条多行插入
+        # 查询已有日期后其它进程可能已写入同一日期，INSERT IGNORE 按 uk_today 跳过，不会让整批回滚
+        insert_sql = """
+        INSERT IGNORE INTO today (today, yearTips, weekDay, lunarCalendar, suit, avoid, uptime, typeDes)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """
+        insert_count = DBUtil.execute_many(conn, insert_sql, rows)
 
         logger.info(f"当日表today：新增插入 {insert_count} 条数据，其余为重复数据")
 
     @classmethod
     def process_calendar(cls, month=None):
-        """处理日历数据主流程（无修改）"""
+        """处理日历数据主流程：获取接口数据后写入数据库"""
+        cls.save_calendar(cls.get_calendar_data(month))
+
+    @classmethod
+    def save_calendar(cls, raw_data):
+        """把已获取的日历接口数据写入 rlibiao 和 today 表"""
         logger.info("===== 开始处理日历数据 =====")
-        raw_data = cls.get_calendar_data(month)
         if not raw_data or raw_data.get("code") != 1:
             logger.error("获取日历接口数据失败")
             return
@@ -405,35 +547,31 @@ class CalendarHandler:
             logger.warning("日历接口返回空数据")
             return
 
-        conn = DBUtil.get_connection()
-        if not conn:
-            return
-
-        try:
+        with DBUtil.connection() as conn:
+            if not conn:
+                return
             cls.insert_rlibiao(calendar_data, conn)
             cls.insert_today(calendar_data, conn)
             logger.info("日历数据处理完成")
-        finally:
-            DBUtil.close_connection(conn)
 
 
 class WeatherHandler:
-    """天气数据处理模块（完全未动）"""
+    """天气数据处理模块：并行获取 LOCATION 中各城市的实时天气和3天预报，按城市写入数据库"""
 
     @staticmethod
-    def get_weather_now():
-        """获取实时天气数据"""
+    def get_weather_now(location=None):
+        """获取实时天气数据（默认使用配置的第一个城市）"""
         config = API_CONFIG["weather"]
-        url = f"{config['now_url']}?location={config['location']}"
+        url = f"{config['now_url']}?location={location or config['location']}"
         headers = {'X-QW-Api-Key': config['api_key']}
         data = ApiUtil.send_get_request(url, headers)
         return data["now"] if data and data.get("code") == "200" else None
 
     @staticmethod
-    def get_3d_forecast():
-        """获取3天预报数据"""
+    def get_3d_forecast(location=None):
+        """获取3天预报数据（默认使用配置的第一个城市）"""
         config = API_CONFIG["weather"]
-        url = f"{config['3d_url']}?location={config['location']}"
+        url = f"{config['3d_url']}?location={location or config['location']}"
         headers = {'X-QW-Api-Key': config['api_key']}
         data = ApiUtil.send_get_request(url, headers)
         if data and data.get("code") == "200":
@@ -443,84 +581,106 @@ class WeatherHandler:
             }
         return None
 
+    @staticmethod
+    def fetch_locations(locations=None):
+        """并发获取多个城市的实时天气和3天预报，返回 {城市: (实时天气, 3天预报)}"""
+        locations = locations or API_CONFIG["weather"]["locations"]
+        with ThreadPoolExecutor(max_workers=WEATHER_WORKERS, thread_name_prefix="weather") as executor:
+            futures = {
+                location: (
+                    executor.submit(WeatherHandler.get_weather_now, location),
+                    executor.submit(WeatherHandler.get_3d_forecast, location),
+                )
+                for location in locations
+            }
+            return {
+                location: (now_future.result(), forecast_future.result())
+                for location, (now_future, forecast_future) in futures.items()
+            }
+
+    @staticmethod
+    def build_weather_rows(location, now_data, forecast_data):
+        """把一个城市的实时天气和3天预报整理为 weather 表的行，当天使用实时数据"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        forecast_list = forecast_data["daily"]
+        forecast_update_time = forecast_data["updateTime"]
+        updateTime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        rows = []
+        for forecast in forecast_list:
+            fx_date = forecast.get("fxDate", "")
+            if not fx_date:
+                logger.warning("预报数据缺少日期字段，跳过")
+                continue
+
+            tempMax = forecast.get("tempMax", "")
+            tempMin = forecast.get("tempMin", "")
+            iconDay = forecast.get("iconDay", "")
+            textDay = forecast.get("textDay", "")
+            weekDay = DateUtil.get_weekday(fx_date)
+
+            if fx_date == today:
+                temp = now_data.get("temp", "")
+                feelslike = now_data.get("feelsLike", "")
+                icon = now_data.get("icon", "")
+                text = now_data.get("text", "")
+                windDir = now_data.get("windDir", "")
+                windScale = now_data.get("windScale", "")
+                humidity = now_data.get("humidity", "")
+                obsTime = DateUtil.convert_time_format(now_data.get("obsTime", ""))
+            else:
+                temp = ""
+                feelslike = ""
+                icon = ""
+                text = ""
+                windDir = forecast.get("windDirDay", "")
+                windScale = forecast.get("windScaleDay", "")
+                humidity = forecast.get("humidity", "")
+                obsTime = DateUtil.convert_time_format(forecast_update_time)
+
+            rows.append((
+                location, fx_date, temp, feelslike, icon, textDay, text, windDir,
+                windScale, humidity, obsTime, updateTime, weekDay,
+                tempMax, tempMin, iconDay
+            ))
+        return rows
+
     @classmethod
     def upsert_weather_data(cls):
-        """更新天气数据（删旧插新）"""
-        logger.info("===== 开始处理天气数据 =====")
-        now_data = cls.get_weather_now()
-        forecast_data = cls.get_3d_forecast()
+        """更新天气数据：并发获取所有城市的实时天气和3天预报后写入数据库"""
+        cls.save_weather(cls.fetch_locations())
 
-        if not now_data or not forecast_data or not forecast_data.get("daily"):
+    @classmethod
+    def save_weather(cls, weather_data):
+        """按 (城市, 日期) 整行替换天气数据，所有城市和日期在一条语句、一个事务中完成"""
+        logger.info("===== 开始处理天气数据 =====")
+        rows = []
+        for location, (now_data, forecast_data) in (weather_data or {}).items():
+            if not now_data or not forecast_data or not forecast_data.get("daily"):
+                logger.error(f"城市 {location} 缺少实时/预报数据，跳过")
+                continue
+            rows.extend(cls.build_weather_rows(location, now_data, forecast_data))
+        if not rows:
             logger.error("缺少实时/预报数据，无法处理天气数据")
             return
 
-        conn = DBUtil.get_connection()
-        if not conn:
-            return
-
-        try:
-            today = datetime.now().strftime("%Y-%m-%d")
-            forecast_list = forecast_data["daily"]
-            forecast_update_time = forecast_data["updateTime"]
-
-            for forecast in forecast_list:
-                fx_date = forecast.get("fxDate", "")
-                if not fx_date:
-                    logger.warning("预报数据缺少日期字段，跳过")
-                    continue
-
-                tempMax = forecast.get("tempMax", "")
-                tempMin = forecast.get("tempMin", "")
-                iconDay = forecast.get("iconDay", "")
-                textDay = forecast.get("textDay", "")
-                weekDay = DateUtil.get_weekday(fx_date)
-
-                if fx_date == today:
-                    temp = now_data.get("temp", "")
-                    feelslike = now_data.get("feelsLike", "")
-                    icon = now_data.get("icon", "")
-                    text = now_data.get("text", "")
-                    windDir = now_data.get("windDir", "")
-                    windScale = now_data.get("windScale", "")
-                    humidity = now_data.get("humidity", "")
-                    obsTime = DateUtil.convert_time_format(now_data.get("obsTime", ""))
-                else:
-                    temp = ""
-                    feelslike = ""
-                    icon = ""
-                    text = ""
-                    windDir = forecast.get("windDirDay", "")
-                    windScale = forecast.get("windScaleDay", "")
-                    humidity = forecast.get("humidity", "")
-                    obsTime = DateUtil.convert_time_format(forecast_update_time)
-
-                updateTime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-                # 删除旧数据
-                delete_sql = "DELETE FROM weather WHERE date = %s"
-                _, del_count = DBUtil.execute_sql(conn, delete_sql, (fx_date,), commit=True)
-                logger.info(f"删除 {fx_date} 旧天气数据 {del_count} 条")
-
-                # 插入新数据
-                insert_sql = """
-                INSERT INTO weather (
-                    date, temp, feelslike, icon, textDay, text, windDir, 
-                    windScale, humidity, obsTime, updateTime, weekDay, 
-                    tempMax, tempMin, iconDay
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """
-                insert_params = (
-                    fx_date, temp, feelslike, icon, textDay, text, windDir,
-                    windScale, humidity, obsTime, updateTime, weekDay,
-                    tempMax, tempMin, iconDay
-                )
-                _, ins_count = DBUtil.execute_sql(conn, insert_sql, insert_params, commit=True)
-                if ins_count > 0:
-                    logger.info(f"插入 {fx_date} 天气数据成功（{weekDay}）")
+        with DBUtil.connection() as conn:
+            if not conn:
+                return
+
+            # 依赖 weather (location, date) 上的唯一索引：已有的旧行被替换，读取方不会看到缺失的日期
+            replace_sql = """
+            REPLACE INTO weather (
+                location, date, temp, feelslike, icon, textDay, text, windDir, 
+                windScale, humidity, obsTime, updateTime, weekDay, 
+                tempMax, tempMin, iconDay
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """
+            row_count = DBUtil.execute_many(conn, replace_sql, rows)
+            if row_count > 0:
+                logger.info(f"写入 {len({row[0] for row in rows})} 个城市共 {len(rows)} 条天气数据成功")
 
             logger.info("天气数据处理完成")
-        finally:
-            DBUtil.close_connection(conn)
 
 
 class HitokotoHandler:
@@ -544,18 +704,20 @@ class HitokotoHandler:
 
     @classmethod
     def process_hitokoto(cls):
-        """处理一言数据主流程"""
+        """处理一言数据主流程：获取接口数据后写入数据库"""
+        cls.save_hitokoto(cls.get_hitokoto_data())
+
+    @classmethod
+    def save_hitokoto(cls, hitokoto_data):
+        """把已获取的一言数据写入 hitokoto 表"""
         logger.info("===== 开始处理一言数据 =====")
-        hitokoto_data = cls.get_hitokoto_data()
         if not hitokoto_data:
             logger.error("获取一言数据失败")
             return
 
-        conn = DBUtil.get_connection()
-        if not conn:
-            return
-
-        try:
+        with DBUtil.connection() as conn:
+            if not conn:
+                return
             insert_sql = """
             INSERT INTO hitokoto (hitokoto, `from`)
             VALUES (%(hitokoto)s, %(from)s)
@@ -563,30 +725,51 @@ class HitokotoHandler:
             _, row_count = DBUtil.execute_sql(conn, insert_sql, hitokoto_data, commit=True)
             if row_count > 0:
                 logger.info(f"成功插入一言数据：{hitokoto_data['hitokoto']}（来源：{hitokoto_data['from']}）")
-        finally:
-            DBUtil.close_connection(conn)
 
 
 # ===================== 主程序入口 =====================
+def fetch_all():
+    """并发请求所有上游接口，总耗时取决于最慢的接口；失败的接口结果为 None"""
+    logger.info("===== 开始并发获取接口数据 =====")
+    tasks = {
+        "calendar": CalendarHandler.get_calendar_data,
+        "weather": WeatherHandler.fetch_locations,
+        "hitokoto": HitokotoHandler.get_hitokoto_data,
+    }
+    results = {}
+    with ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="fetch") as executor:
+        futures = {name: executor.submit(func) for name, func in tasks.items()}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.error(f"接口 {name} 获取异常: {e}")
+                results[name] = None
+    return results
+
+
 def main():
-    """主执行函数（完全未动）"""
+    """主执行函数：先并发获取所有接口数据，再依次写入数据库"""
     logger.info("===== 程序开始执行 =====")
 
+    data = fetch_all()
+
     try:
-        CalendarHandler.process_calendar()
+        CalendarHandler.save_calendar(data["calendar"])
     except Exception as e:
         logger.error(f"日历模块执行异常: {e}，继续执行其他模块")
 
     try:
-        WeatherHandler.upsert_weather_data()
+        WeatherHandler.save_weather(data["weather"])
     except Exception as e:
         logger.error(f"天气模块执行异常: {e}，继续执行其他模块")
 
     try:
-        HitokotoHandler.process_hitokoto()
+        HitokotoHandler.save_hitokoto(data["hitokoto"])
     except Exception as e:
         logger.error(f"一言模块执行异常: {e}")
 
+    DBUtil.pool.close_all()
     logger.info("===== 程序执行完成 =====")
 
 
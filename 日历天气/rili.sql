@@ -40,7 +40,8 @@ CREATE TABLE `rlibiao` (
   `lunarCalendar` varchar(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NOT NULL COMMENT '农历',
   `typeDes` varchar(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci DEFAULT NULL COMMENT '节日',
   `type` tinyint unsigned NOT NULL COMMENT '上班还是休',
-  PRIMARY KEY (`id`)
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uk_date` (`date`)
 ) ENGINE=InnoDB AUTO_INCREMENT=311 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
 -- ----------------------------
@@ -57,7 +58,8 @@ CREATE TABLE `today` (
   `suit` varchar(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci DEFAULT NULL COMMENT '黄历-宜',
   `avoid` varchar(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci DEFAULT NULL COMMENT '黄历-忌',
   `uptime` timestamp NULL DEFAULT NULL ON UPDATE CURRENT_TIMESTAMP,
-  PRIMARY KEY (`id`)
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uk_today` (`today`)
 ) ENGINE=InnoDB AUTO_INCREMENT=435 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
 -- ----------------------------
@@ -66,6 +68,7 @@ CREATE TABLE `today` (
 DROP TABLE IF EXISTS `weather`;
 CREATE TABLE `weather` (
   `id` int NOT NULL AUTO_INCREMENT,
+  `location` varchar(64) COLLATE utf8mb4_general_ci NOT NULL DEFAULT '' COMMENT '城市ID',
   `weekDay` varchar(255) COLLATE utf8mb4_general_ci DEFAULT NULL COMMENT '周几',
   `date` date DEFAULT NULL,
   `tempMin` varchar(255) COLLATE utf8mb4_general_ci DEFAULT NULL,
@@ -81,7 +84,8 @@ CREATE TABLE `weather` (
   `humidity` varchar(255) COLLATE utf8mb4_general_ci DEFAULT NULL,
   `obsTime` datetime DEFAULT NULL,
   `updateTime` datetime DEFAULT NULL ON UPDATE CURRENT_TIMESTAMP,
-  PRIMARY KEY (`id`)
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uk_location_date` (`location`,`date`)
 ) ENGINE=InnoDB AUTO_INCREMENT=54 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
 SET FOREIGN_KEY_CHECKS = 1;